@@ -3,20 +3,29 @@
 update_channel.py - stdlib-only, with safer headers and simple retry for Cloudflare 1010 blocks.
 
 - Computes RP month/year from the Compupro URL anchor parameters.
-- Uses urllib to GET the channel and PATCH the name only when needed.
+- Uses one keep-alive http.client connection to GET the channel and PATCH the name only when needed.
 - Sets a realistic User-Agent and Accept headers (helps avoid Cloudflare WAF 1010).
 - If Discord returns a 403 with 'error code: 1010' in the body, the script will retry a few times with backoff.
-- Read DISCORD_TOKEN (required) and optional CHANNEL_ID from environment variables.
+- On 429/503/1010 it sleeps for Retry-After (or the backoff table if absent) and retries; once the total wait would exceed RETRY_MAX_SLEEP_SEC it leaves it to the next scheduled run.
+- Read DISCORD_TOKEN (required) and optional CHANNEL_ID / CHANNEL_IDS (comma-separated) from environment variables.
+- Spaces requests to stay inside Discord's 5-requests-per-5-seconds bucket when updating several channels.
+- Remembers the last name it set (STATE_FILE) and skips Discord entirely until the next RP month starts.
+- Revalidates the channel with If-None-Match when Discord has handed out an ETag.
+- After an RP month rollover it PATCHes straight away (the channel still has the cached name); pass --verify to GET first.
 """
 
 import os
 import math
+import re
+import sys
 import json
 import time
-from urllib.parse import urlparse, parse_qs
-from urllib.request import Request, urlopen
+import random
+import functools
+from collections import deque, namedtuple
+from http.client import HTTPSConnection, HTTPException
 from urllib.error import HTTPError, URLError
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 # ---------------- CONFIG ----------------
 COMPUPRO_URL = (
@@ -24,12 +33,34 @@ COMPUPRO_URL = (
     "?daysperyear=7&lastdatechange=1757721600000&lastdateepoch=-4449513600000&fixedyears=true"
 )
 
-CHANNEL_ID = int(os.getenv("CHANNEL_ID", "1417630872924061846"))
+# Anchor values derived once from COMPUPRO_URL; the hot path only does integer math on them
+_QS_RE = re.compile(r"(?:^|[?&])(daysperyear|lastdatechange|lastdateepoch)=(-?\d+)")
+
+
+def _parse_compupro(url):
+    """Return (daysperyear, lastdatechange_ms, lastdateepoch_ms) from a compupro calculator URL."""
+    qs = dict(_QS_RE.findall(url))
+    return int(qs.get("daysperyear", "7")), int(qs["lastdatechange"]), int(qs["lastdateepoch"])
+
+
+DAYS_PER_YEAR, ANCHOR_REAL_MS, ANCHOR_RP_EPOCH_MS = _parse_compupro(COMPUPRO_URL)
+MONTHS_PER_YEAR = 12
+# 24*3600*1000 is divisible by 12, so this is exact for any daysperyear
+MONTH_MS = DAYS_PER_YEAR * 24 * 3600 * 1000 // MONTHS_PER_YEAR
+ANCHOR_RP_YEAR = (datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(milliseconds=ANCHOR_RP_EPOCH_MS)).year
+
+# Optional comma-separated list of channels to keep in sync; falls back to CHANNEL_ID only when empty.
+# Unset GitHub secrets arrive as empty env vars, so "" is treated the same as unset.
+CHANNEL_IDS = [int(c) for c in os.getenv("CHANNEL_IDS", "").split(",") if c.strip()] or [
+    int(os.getenv("CHANNEL_ID") or "1417630872924061846")
+]
+CHANNEL_ID = CHANNEL_IDS[0]
 TOKEN = os.getenv("DISCORD_TOKEN")
 if not TOKEN:
     raise SystemExit("DISCORD_TOKEN environment variable not set. Add it to GitHub Secrets or env.")
 
-DISCORD_API_BASE = "https://discord.com/api/v10"
+DISCORD_API_HOST = "discord.com"
+DISCORD_API_BASE = "/api/v10"
 MONTH_NAMES = [
     "January","February","March","April","May","June",
     "July","August","September","October","November","December"
@@ -38,62 +69,117 @@ MONTH_NAMES = [
 # User-Agent string: replace URL with your repo if you like
 USER_AGENT = "DiscordBot (https://github.com/yourname/discord-month-bot, v1.0)"
 
+# Per channel: last successfully-set name + when it expires; skips all HTTP while still valid
+STATE_FILE = os.getenv("STATE_FILE", ".last_channel_name.json")
+
 # Retry config for 1010 Cloudflare WAF responses
 RETRY_COUNT = 3
 RETRY_BACKOFF_SEC = [2, 6, 20]  # seconds
 
+# 429/503/1010 handling: honor Retry-After, but give up (next scheduled run retries) past this much
+# total sleeping per request; sized to fit the whole jittered RETRY_BACKOFF_SEC table (<= 1.5x each)
+RETRY_MAX_SLEEP_SEC = 45
 
-# ---------------- Helpers ----------------
-def now_ms_utc():
-    return datetime.now(timezone.utc).timestamp() * 1000.0
+# Client-side request spacing: at most RATE_BUCKET_SIZE requests per RATE_BUCKET_WINDOW_SEC
+RATE_BUCKET_SIZE = 5
+RATE_BUCKET_WINDOW_SEC = 5.0
 
 
-def rp_from_compupro_url(url):
-    """Parse compupro URL query params and compute current RP year/month."""
-    qs = parse_qs(urlparse(url).query)
-    daysperyear = int(qs.get("daysperyear", ["7"])[0])
-    lastdatechange_ms = int(qs.get("lastdatechange")[0])
-    lastdateepoch_ms = int(qs.get("lastdateepoch")[0])
+# ---------------- Helpers ----------------
+RPInfo = namedtuple("RPInfo", [
+    "current_year", "current_month", "ms_into_month", "month_ms",
+    "anchor_real_ms", "anchor_rp_epoch_ms", "next_month_start_ms", "next_year_start_ms",
+])
 
-    MONTHS_PER_YEAR = 12
-    hours_per_month = (daysperyear * 24) / MONTHS_PER_YEAR
-    month_ms = hours_per_month * 3600 * 1000
 
-    anchor_real_ms = lastdatechange_ms
-    anchor_rp_epoch_ms = lastdateepoch_ms
+def now_ms_utc():
+    return time.time_ns() // 1_000_000
 
-    now_ms = now_ms_utc()
-    elapsed_ms = now_ms - anchor_real_ms
 
-    total_months = math.floor(elapsed_ms / month_ms)
+def rp_now():
+    """Compute current RP year/month from the precomputed compupro anchor constants."""
+    elapsed_ms = now_ms_utc() - ANCHOR_REAL_MS
+
+    total_months = elapsed_ms // MONTH_MS
     years_elapsed = total_months // MONTHS_PER_YEAR
-    anchor_rp_dt = datetime.utcfromtimestamp(anchor_rp_epoch_ms / 1000.0)
 
-    current_year = anchor_rp_dt.year + years_elapsed
+    current_year = ANCHOR_RP_YEAR + years_elapsed
     current_month = (total_months % MONTHS_PER_YEAR) + 1
-    ms_into_month = int(elapsed_ms - (total_months * month_ms))
+    ms_into_month = elapsed_ms - total_months * MONTH_MS
 
     # next month & next year real timestamps (ms)
-    next_month_start_ms = int(anchor_real_ms + (total_months + 1) * month_ms)
+    next_month_start_ms = ANCHOR_REAL_MS + (total_months + 1) * MONTH_MS
     months_until_year_end = MONTHS_PER_YEAR - ((total_months % MONTHS_PER_YEAR) + 1) + 1
-    next_year_start_ms = int(anchor_real_ms + (total_months + months_until_year_end) * month_ms)
-
-    return {
-        "current_year": int(current_year),
-        "current_month": int(current_month),
-        "ms_into_month": ms_into_month,
-        "month_ms": int(month_ms),
-        "anchor_real_ms": int(anchor_real_ms),
-        "anchor_rp_epoch_ms": int(anchor_rp_epoch_ms),
-        "next_month_start_ms": next_month_start_ms,
-        "next_year_start_ms": next_year_start_ms,
-    }
+    next_year_start_ms = ANCHOR_REAL_MS + (total_months + months_until_year_end) * MONTH_MS
+
+    return RPInfo(
+        current_year=current_year,
+        current_month=current_month,
+        ms_into_month=ms_into_month,
+        month_ms=MONTH_MS,
+        anchor_real_ms=ANCHOR_REAL_MS,
+        anchor_rp_epoch_ms=ANCHOR_RP_EPOCH_MS,
+        next_month_start_ms=next_month_start_ms,
+        next_year_start_ms=next_year_start_ms,
+    )
+
+
+@functools.lru_cache(maxsize=4)
+def _channel_name(year, month):
+    """Format the channel name; (year, month) only changes once per RP month, so this is memoized."""
+    # month is always 1..12 (total_months % 12 + 1), no need to wrap again
+    return f"📅 {MONTH_NAMES[month - 1]} {year}"
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize_channel_name(name):
+    """Discord lowercases text-channel names and turns whitespace into dashes; compare in that form."""
+    return _WHITESPACE_RE.sub("-", name.strip().lower())
 
 
 def compute_channel_name():
-    info = rp_from_compupro_url(COMPUPRO_URL)
-    month_name = MONTH_NAMES[(info["current_month"] - 1) % 12]
-    return f"📅 {month_name} {info['current_year']}", info
+    info = rp_now()
+    return _channel_name(info.current_year, info.current_month), info
+
+
+# ---------------- Local state ----------------
+def load_state(path=STATE_FILE):
+    """Return the cached {channel_id: {"name", "valid_until_ms", "etag"}} dict ({} if missing/unreadable)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            states = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(states, dict):
+        return {}
+    return {cid: st for cid, st in states.items() if _valid_state_entry(st)}
+
+
+def _valid_state_entry(st):
+    """Entries restored from actions/cache are untrusted; malformed ones are dropped instead of crashing main()."""
+    return (
+        isinstance(st, dict)
+        and isinstance(st.get("name"), str)
+        and isinstance(st.get("valid_until_ms"), int)
+        and not isinstance(st.get("valid_until_ms"), bool)
+        and isinstance(st.get("etag"), (str, type(None)))
+    )
+
+
+def save_state(states, path=STATE_FILE):
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(states, f)
+    except OSError as e:
+        print("Failed to write state file:", e)
+
+
+def remember_channel(states, channel_id, name, valid_until_ms, etag=None):
+    """Record a confirmed name and persist. etag, if given, must be the ETag for which `name` is current."""
+    states[str(channel_id)] = {"name": name, "valid_until_ms": valid_until_ms, "etag": etag}
+    save_state(states)
 
 
 # --------- HTTP helpers with headers + retry for 1010 ----------
@@ -109,82 +195,155 @@ def _build_headers(token=None, extra=None):
     return headers
 
 
-def http_get_with_retries(url, token=None, retries=RETRY_COUNT):
-    """GET with retry when Cloudflare 1010 is encountered."""
-    attempt = 0
-    last_exc = None
-    while attempt <= retries:
-        headers = _build_headers(token)
-        req = Request(url, headers=headers, method="GET")
+def _retry_after_seconds(headers, body, status):
+    """Seconds Discord asked us to wait (max of Retry-After header and JSON retry_after), or None if absent.
+
+    The body is only parsed for 429s or JSON responses, so Cloudflare HTML error pages are never fed to json.
+    """
+    candidates = []
+    try:
+        candidates.append(float(headers.get("Retry-After")))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    content_type = headers.get("Content-Type", "") if headers else ""
+    if status == 429 or content_type.startswith("application/json"):
         try:
-            with urlopen(req, timeout=15) as resp:
-                return resp.read().decode("utf-8"), resp.getcode()
-        except HTTPError as e:
-            body = None
-            try:
-                body = e.read().decode("utf-8", errors="ignore")
-            except Exception:
-                body = ""
-            # Detect Cloudflare 1010 block pattern in response body
-            if "error code: 1010" in (body or "") and attempt < retries:
-                wait = RETRY_BACKOFF_SEC[min(attempt, len(RETRY_BACKOFF_SEC)-1)]
-                print(f"GET received 1010 block; attempt {attempt+1}/{retries}. backing off {wait}s and retrying...")
-                time.sleep(wait)
-                attempt += 1
-                continue
-            # otherwise re-raise the HTTPError with body info
-            raise HTTPError(e.url, e.code, f"{e.reason} - body: {body}", e.headers, None)
-        except URLError as e:
-            last_exc = e
-            # URLError is probably network; retry a couple times
-            if attempt < retries:
-                wait = RETRY_BACKOFF_SEC[min(attempt, len(RETRY_BACKOFF_SEC)-1)]
-                print(f"GET URLError: {e}. attempt {attempt+1}/{retries}. waiting {wait}s...")
-                time.sleep(wait)
-                attempt += 1
-                continue
-            raise
-    if last_exc:
-        raise last_exc
-    raise RuntimeError("GET failed after retries")
+            candidates.append(float(json.loads(body).get("retry_after")))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    # "-1", "nan", "inf" parse as floats but are not usable sleep durations
+    candidates = [c for c in candidates if math.isfinite(c) and c >= 0]
+    return max(candidates) if candidates else None
+
+
+# Default headers (incl. Authorization) built once at import, shared by every request
+SESSION_HEADERS = _build_headers(TOKEN)
+SESSION_JSON_HEADERS = _build_headers(TOKEN, extra={"Content-Type": "application/json"})
+
+
+def open_discord_conn():
+    """One keep-alive HTTPS connection, reused for every request in a run (single TLS handshake)."""
+    return HTTPSConnection(DISCORD_API_HOST, timeout=15)
+
+
+# Everything _request_with_policy needs to decide whether/how long to wait before retrying
+RetryPolicy = namedtuple("RetryPolicy", [
+    "max_retries", "base_delays", "retry_on_codes", "retry_on_body_substr", "max_retry_sleep",
+])
+
+DEFAULT_RETRY_POLICY = RetryPolicy(
+    max_retries=RETRY_COUNT,
+    base_delays=tuple(RETRY_BACKOFF_SEC),
+    # Only these statuses are transient (rate limit / unavailable); other 4xx/5xx are final
+    retry_on_codes=frozenset({429, 503}),
+    # Status -> body markers that make it transient; Cloudflare's WAF block is a 403 recognizable only by its body
+    retry_on_body_substr={403: (b"error code: 1010",)},
+    max_retry_sleep=RETRY_MAX_SLEEP_SEC,
+)
+
+
+_REQUEST_TIMES = deque(maxlen=RATE_BUCKET_SIZE)
+
+
+def _wait_for_bucket():
+    """Block until another request fits in the RATE_BUCKET_SIZE / RATE_BUCKET_WINDOW_SEC window."""
+    if len(_REQUEST_TIMES) == RATE_BUCKET_SIZE:
+        delta = RATE_BUCKET_WINDOW_SEC - (time.monotonic() - _REQUEST_TIMES[0])
+        if delta > 0:
+            print(f"Pacing requests: sleeping {delta:.2f}s to stay inside the rate-limit bucket...")
+            time.sleep(delta)
+    _REQUEST_TIMES.append(time.monotonic())
+
 
+def _backoff_seconds(attempt, policy=DEFAULT_RETRY_POLICY):
+    """Jittered backoff (0.5x-1.5x the table entry) so concurrent runs don't retry in lockstep."""
+    delays = policy.base_delays
+    base = delays[min(attempt, len(delays)-1)]
+    return min(base * (0.5 + random.random()), delays[-1] * 1.5)
 
-def http_patch_json_with_retries(url, token, data, retries=RETRY_COUNT):
-    """PATCH JSON with retry on 1010 or transient network errors."""
+
+def _should_retry(raw, code, policy=DEFAULT_RETRY_POLICY):
+    """Whether an error response is transient under `policy`.
+
+    Checks the raw body bytes so large Cloudflare error pages are not decoded just to be searched.
+    A plain 403 is a real permission error; only the marked (1010) variant is retried.
+    """
+    if code in policy.retry_on_codes:
+        return True
+    return any(marker in raw for marker in policy.retry_on_body_substr.get(code, ()))
+
+
+def _request_with_policy(conn, method, path, *, body_bytes=None, headers=SESSION_HEADERS, policy=DEFAULT_RETRY_POLICY):
+    """Send one request over conn, retrying per `policy` (rate limits, 1010 blocks, network errors).
+
+    Returns (body bytes, status, response headers) for status < 400; raises HTTPError/URLError otherwise.
+    policy._replace(max_retries=0) sends the request exactly once.
+    """
+    url = f"https://{DISCORD_API_HOST}{path}"
+    retries = policy.max_retries
     attempt = 0
     last_exc = None
-    body_bytes = json.dumps(data).encode("utf-8")
+    retry_slept = 0.0
     while attempt <= retries:
-        headers = _build_headers(token, extra={"Content-Type": "application/json"})
-        req = Request(url, data=body_bytes, headers=headers, method="PATCH")
+        _wait_for_bucket()
         try:
-            with urlopen(req, timeout=15) as resp:
-                return resp.read().decode("utf-8"), resp.getcode()
-        except HTTPError as e:
-            body = None
-            try:
-                body = e.read().decode("utf-8", errors="ignore")
-            except Exception:
-                body = ""
-            if "error code: 1010" in (body or "") and attempt < retries:
-                wait = RETRY_BACKOFF_SEC[min(attempt, len(RETRY_BACKOFF_SEC)-1)]
-                print(f"PATCH received 1010 block; attempt {attempt+1}/{retries}. backing off {wait}s and retrying...")
+            conn.request(method, path, body=body_bytes, headers=headers)
+            resp = conn.getresponse()
+            raw = resp.read()
+        except (OSError, HTTPException) as e:
+            # Network-level failure; drop the socket so the next attempt reconnects
+            conn.close()
+            last_exc = URLError(e)
+            if attempt < retries:
+                wait = _backoff_seconds(attempt, policy)
+                print(f"{method} URLError: {last_exc}. attempt {attempt+1}/{retries}. waiting {wait:.2f}s...")
                 time.sleep(wait)
                 attempt += 1
                 continue
-            raise HTTPError(e.url, e.code, f"{e.reason} - body: {body}", e.headers, None)
-        except URLError as e:
-            last_exc = e
-            if attempt < retries:
-                wait = RETRY_BACKOFF_SEC[min(attempt, len(RETRY_BACKOFF_SEC)-1)]
-                print(f"PATCH URLError: {e}. attempt {attempt+1}/{retries}. waiting {wait}s...")
+            raise last_exc
+        if resp.status < 400:
+            return raw, resp.status, resp.headers
+        if attempt < retries and _should_retry(raw, resp.status, policy):
+            retry_after = _retry_after_seconds(resp.headers, raw, resp.status)
+            if retry_after is None:
+                retry_after = _backoff_seconds(attempt, policy)
+            if resp.status == 429:
+                wait = retry_after + random.uniform(0, 0.25)
+                reason = "rate limited (429)"
+            else:
+                wait = retry_after
+                reason = "received 1010 block" if resp.status == 403 else f"received {resp.status}"
+            if retry_slept + wait <= policy.max_retry_sleep:
+                print(f"{method} {reason}; attempt {attempt+1}/{retries}. backing off {wait:.2f}s and retrying...")
                 time.sleep(wait)
+                retry_slept += wait
                 attempt += 1
                 continue
-            raise
+            print(f"{method} {reason}; waiting {wait:.2f}s would exceed {policy.max_retry_sleep}s, leaving it to the next run.")
+        # otherwise raise an HTTPError with body info (only now is the body decoded)
+        body = raw.decode("utf-8", errors="ignore")
+        raise HTTPError(url, resp.status, f"{resp.reason} - body: {body}", resp.headers, None)
     if last_exc:
         raise last_exc
-    raise RuntimeError("PATCH failed after retries")
+    raise RuntimeError(f"{method} failed after retries")
+
+
+def http_get_with_retries(conn, path, etag=None, session_headers=SESSION_HEADERS, policy=DEFAULT_RETRY_POLICY):
+    """GET with retry when Cloudflare 1010 is encountered.
+
+    Returns (body bytes, status, etag). With `etag`, sends If-None-Match; a 304 comes back with an empty body.
+    """
+    if etag:
+        session_headers = {**session_headers, "If-None-Match": etag}
+    raw, status, headers = _request_with_policy(conn, "GET", path, headers=session_headers, policy=policy)
+    return raw, status, headers.get("ETag")
+
+
+def http_patch_json_with_retries(conn, path, data, session_headers=SESSION_JSON_HEADERS, policy=DEFAULT_RETRY_POLICY):
+    """PATCH JSON with retry on 1010 or transient network errors. session_headers must carry the JSON Content-Type."""
+    body_bytes = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    raw, status, _ = _request_with_policy(conn, "PATCH", path, body_bytes=body_bytes, headers=session_headers, policy=policy)
+    return raw, status
 
 
 # ---------------- Main ----------------
@@ -192,69 +351,106 @@ def iso_from_ms(ms):
     return datetime.fromtimestamp(ms / 1000.0, tz=timezone.utc).isoformat()
 
 
-def main():
-    print("=== Run UTC:", datetime.now(timezone.utc).isoformat())
-    new_name, info = compute_channel_name()
-    print("Computed channel name:", new_name)
-    print(f"  current_year: {info['current_year']} current_month: {info['current_month']}")
-    print(f"  ms into month: {info['ms_into_month']} month length ms: {info['month_ms']}")
-    print("  next_month_start (UTC):", iso_from_ms(info["next_month_start_ms"]))
-    print("  next_year_start (UTC):", iso_from_ms(info["next_year_start_ms"]))
-    print("  anchor real ms (UTC):", iso_from_ms(info["anchor_real_ms"]))
+def patch_channel_name(conn, channel_id, new_name, info, states):
+    """PATCH the channel name and record it in the state file on success."""
+    channel_path = f"{DISCORD_API_BASE}/channels/{channel_id}"
+    try:
+        resp_body, resp_code = http_patch_json_with_retries(conn, channel_path, {"name": new_name})
+    except HTTPError as e:
+        print(f"PATCH HTTPError: {e.code} {e.msg if hasattr(e, 'msg') else e.reason}")
+        print("PATCH error body (if any):", e.msg)
+        return
+    except URLError as e:
+        print("PATCH URLError:", e)
+        return
+
+    print("PATCH returned:", resp_code, resp_body.decode("utf-8", errors="replace"))
+    if 200 <= resp_code < 300:
+        remember_channel(states, channel_id, new_name, info.next_month_start_ms)
+
+
+def update_one(conn, channel_id, new_name, info, states, verify=False):
+    """GET one channel and PATCH its name if it differs, reusing conn for both requests."""
+    print(f"--- Channel {channel_id}")
+    channel_path = f"{DISCORD_API_BASE}/channels/{channel_id}"
+    state = states.get(str(channel_id))
+    if not verify and state and state.get("name") == new_name and now_ms_utc() < state.get("valid_until_ms", 0):
+        # Another channel needed work, but this one is still confirmed for the current RP month
+        print("Cached name valid until", iso_from_ms(state["valid_until_ms"]), "- nothing to do.")
+        return
+    if not verify and state and state.get("name") and state["name"] != new_name:
+        # The channel still carries the name we set last RP month, so the GET would only confirm it differs
+        print(f"RP month rolled over since {state['name']!r} was set; patching without GET.")
+        patch_channel_name(conn, channel_id, new_name, info, states)
+        return
 
-    channel_url = f"{DISCORD_API_BASE}/channels/{CHANNEL_ID}"
+    cached_etag = state.get("etag") if state else None
     try:
-        body, status = http_get_with_retries(channel_url, TOKEN)
+        body, status, etag = http_get_with_retries(conn, channel_path, etag=cached_etag)
     except HTTPError as e:
         # HTTPError raised with enriched message
         print(f"GET channel HTTPError: {e.code} {e.msg if hasattr(e, 'msg') else e.reason}")
-        try:
-            print("GET error body (if any):", e.msg)
-        except Exception:
-            pass
+        print("GET error body (if any):", e.msg)
         return
     except URLError as e:
         print("GET channel URLError:", e)
         return
-    except Exception as e:
-        print("GET channel unexpected error:", e)
-        return
 
-    if status != 200:
-        print("GET channel returned non-200:", status, body)
-        return
-
-    try:
-        info_json = json.loads(body)
-    except Exception as e:
-        print("Failed to parse channel JSON:", e)
+    if status == 304:
+        # Channel unchanged since the cached ETag, so its name is still the cached one
+        current_name = state.get("name")
+        etag = cached_etag
+        print("Channel not modified since last run (304); cached name:", current_name)
+    elif status != 200:
+        print("GET channel returned non-200:", status, body.decode("utf-8", errors="replace"))
         return
+    else:
+        try:
+            info_json = json.loads(body)  # bytes in: decoded + parsed in one pass
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            print("Failed to parse channel JSON:", e)
+            return
 
-    current_name = info_json.get("name")
-    print("Current channel name:", current_name)
+        current_name = info_json.get("name")
+        print("Current channel name:", current_name)
 
-    if current_name == new_name:
+    if current_name is not None and _normalize_channel_name(current_name) == _normalize_channel_name(new_name):
         print("Channel name already up to date; nothing to do.")
+        remember_channel(states, channel_id, new_name, info.next_month_start_ms, etag=etag)
         return
 
-    # Attempt patch
-    try:
-        resp_text, resp_code = http_patch_json_with_retries(channel_url, TOKEN, {"name": new_name})
-    except HTTPError as e:
-        print(f"PATCH HTTPError: {e.code} {e.msg if hasattr(e, 'msg') else e.reason}")
-        try:
-            print("PATCH error body (if any):", e.msg)
-        except Exception:
-            pass
-        return
-    except URLError as e:
-        print("PATCH URLError:", e)
-        return
-    except Exception as e:
-        print("PATCH unexpected error:", e)
+    patch_channel_name(conn, channel_id, new_name, info, states)
+
+
+def main():
+    verify = "--verify" in sys.argv[1:]
+    print("=== Run UTC:", datetime.now(timezone.utc).isoformat())
+
+    new_name, info = compute_channel_name()
+
+    # Fast path: skip opening a connection while every channel's cached name is still the computed one
+    # (update_one repeats the check per channel); comparing the name means a config change applies next run
+    states = load_state()
+    now_ms = now_ms_utc()
+    cached = [states.get(str(cid), {}) for cid in CHANNEL_IDS]
+    if not verify and all(st.get("name") == new_name and now_ms < st.get("valid_until_ms", 0) for st in cached):
+        valid_until = min(st["valid_until_ms"] for st in cached)
+        print(f"Cached channel name {new_name!r} valid until", iso_from_ms(valid_until), "- nothing to do.")
         return
 
-    print("PATCH returned:", resp_code, resp_text)
+    print("Computed channel name:", new_name)
+    print(f"  current_year: {info.current_year} current_month: {info.current_month}")
+    print(f"  ms into month: {info.ms_into_month} month length ms: {info.month_ms}")
+    print("  next_month_start (UTC):", iso_from_ms(info.next_month_start_ms))
+    print("  next_year_start (UTC):", iso_from_ms(info.next_year_start_ms))
+    print("  anchor real ms (UTC):", iso_from_ms(info.anchor_real_ms))
+
+    conn = open_discord_conn()
+    try:
+        for channel_id in CHANNEL_IDS:
+            update_one(conn, channel_id, new_name, info, states, verify=verify)
+    finally:
+        conn.close()
 
 
 if __name__ == "__main__":